@@ -0,0 +1,22 @@
+import json
+
+# orjson is considerably faster for the small dicts we (de)serialize, but it
+# stays optional; the stdlib fallback produces the same canonical output
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    def dumps(obj) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS).decode()
+
+    def loads(data):
+        return orjson.loads(data)
+else:
+    def dumps(obj) -> str:
+        # compact separators and sorted keys keep the output canonical
+        return json.dumps(obj, separators=(',', ':'), sort_keys=True)
+
+    def loads(data):
+        return json.loads(data)
@@ -1,16 +1,23 @@
 import os
+import re
 import logging
-import glob
 import datetime
-import asyncio
 import subprocess
-from configparser import ConfigParser
+import threading
+import collections
+import concurrent.futures
 from uscert_manager.store import CertsStore
 from uscert_manager.pip_manager import PipManager
-from uscert_manager.providers import list as providers
 
 __all__ = ['UsCertManager', 'UsCertManagerError', 'UsCertManagerConfigError']
 
+_REQUIRED_OPTIONS = ('provider', 'domains')
+_COMMA_RE = re.compile(r'\s*,\s*')
+
+# renew at most this many certs per daily wake; with a 30 day lead this
+# spreads large backlogs over multiple cycles instead of one huge batch
+_RENEW_BATCH_LIMIT = 100
+
 class UsCertManagerError(Exception):
     pass
 
@@ -18,7 +25,26 @@ class UsCertManagerConfigError(Exception):
     pass
 
 class UsCertManager:
+    __slots__ = (
+        '_config_dirs',
+        '_hooks_dirs',
+        '_certs_dir',
+        '_data_dir',
+        '_bin_path',
+        '_config',
+        '_config_files',
+        '_config_mtime',
+        '_logger',
+        '_certs_store',
+        '_provider_factories',
+        '_cert_providers',
+        '_pip_manager',
+    )
+
     def __init__(self, params: dict) -> None:
+        # deferred so 'uscert-manager --help/--version' never pays for it
+        from uscert_manager.providers import list as providers
+        
         self._config_dirs = self._gen_config_dirs('', params.get('config_dirs', ''))
         self._hooks_dirs = self._gen_config_dirs('hooks', params.get('hooks_dirs', ''))
         
@@ -30,12 +56,13 @@ class UsCertManager:
 
         self._logger: logging.Logger = self._gen_logger(params.get('log_file', ''), params.get('log_level', 'INFO'))
         self._certs_store = CertsStore(self._data_dir, logger=self._logger)
-        self._cert_providers = {x: providers[x](self._certs_dir, self._data_dir, self._bin_path, logger=self._logger) for x in providers}
+        self._provider_factories = providers
+        self._cert_providers = {}
         self._pip_manager = PipManager(self._bin_path, logger=self._logger)
 
     def run(self) -> None:
         user = os.getuid()
-        self._logger.info(f'Starting uscert-manager as user {user}')
+        self._logger.info('Starting uscert-manager as user %s', user)
         
         # make sure config is valid
         self._config_check()
@@ -63,47 +90,79 @@ class UsCertManager:
         if dir:
             return dir
         
-        if not os.path.exists('/var/opt/uscert-manager'):
-            os.makedirs('/var/opt/uscert-manager')
+        os.makedirs('/var/opt/uscert-manager', exist_ok=True)
         
         return os.path.join('/var/opt/uscert-manager', name)
 
-    def _parse_config(self) -> dict:
+    def _find_config_files(self) -> list:
         config_files = []
         
         for config_dir in self._config_dirs:
-            dir_files = [
-                os.path.join(config_dir, 'config.conf'),
-                *glob.glob(os.path.join(config_dir, 'config.d', '*.conf')),
-            ]
+            config_files.append(os.path.join(config_dir, 'config.conf'))
             
-            config_files += dir_files
+            # os.scandir skips the per-entry stat that glob pays for
+            try:
+                with os.scandir(os.path.join(config_dir, 'config.d')) as entries:
+                    config_files += [entry.path for entry in entries if entry.name.endswith('.conf') and entry.is_file()]
+            except FileNotFoundError:
+                pass
+        
+        return config_files
+    
+    def _get_config_mtime(self, config_files: list) -> int:
+        mtime = 0
+        
+        for file in config_files:
+            try:
+                mtime = max(mtime, os.stat(file).st_mtime_ns)
+            except OSError:
+                pass
+        
+        return mtime
+    
+    def _parse_config(self) -> dict:
+        from configparser import ConfigParser, Error as ConfigParserError
+        
+        config_files = self._find_config_files()
+        
+        # remember what was parsed so config reloads can be skipped until
+        # something actually changes
+        self._config_files = config_files
+        self._config_mtime = self._get_config_mtime(config_files)
 
-        config_inst = ConfigParser()
-        config_inst.read(config_files)
+        # values are passed to providers verbatim; %-interpolation is unused
+        # and only costs parse work
+        config_inst = ConfigParser(interpolation=None)
+
+        # normalize parse failures (malformed or non-utf-8 files) so both the
+        # startup handler and the reload guard catch one error type
+        try:
+            config_inst.read(config_files, encoding='utf-8')
+        except (ConfigParserError, UnicodeDecodeError) as e:
+            raise UsCertManagerConfigError(f'Config could not be parsed: {e}') from e
 
         # check if any config was found
         if not config_inst.sections():
             raise UsCertManagerConfigError("No config found")
 
         config = {}
-        required_options = ['provider', 'domains']
 
         for section in config_inst.sections():
             section_data = {}
 
-            # make sure we have all required options
-            for option in required_options:
-                if not config_inst.has_option(section, option):
-                    raise UsCertManagerConfigError(f'Config section "{section}" is missing required option "{option}"')
-
             for key, value in config_inst.items(section):
                 if key == 'domains':
                     # split value by comma and remove any leading/trailing whitespace
-                    value = [x.strip() for x in value.split(',')]
+                    value = _COMMA_RE.split(value.strip())
 
                 section_data[key] = value
 
+            # make sure we have all required options
+            missing = set(_REQUIRED_OPTIONS) - section_data.keys()
+
+            if missing:
+                raise UsCertManagerConfigError(f'Config section "{section}" is missing required option "{next(iter(missing))}"')
+
             config[section] = section_data
 
         return config
@@ -137,17 +196,28 @@ class UsCertManager:
 
         return logger
     
+    def _get_provider(self, name: str):
+        # instantiate providers lazily so unused ones don't pay their init cost
+        if not name in self._cert_providers:
+            self._cert_providers[name] = self._provider_factories[name](self._certs_dir, self._data_dir, self._bin_path, logger=self._logger)
+        
+        return self._cert_providers[name]
+        
     def _config_check(self) -> None:
         self._logger.info('Checking config ...')
         
         for config in self._config.values():
             provider = config.get('provider', '')
-            
-            if not provider in self._cert_providers:
+        
+            if not provider in self._provider_factories:
                 raise UsCertManagerConfigError(f'Provider "{provider}" not found')
-            
-            self._cert_providers[provider].config_check(config)
-            
+        
+            # normalize provider validation errors so reload can catch one type
+            try:
+                self._get_provider(provider).config_check(config)
+            except Exception as e:
+                raise UsCertManagerConfigError(str(e)) from e
+        
         self._logger.info('Config check passed')
     
     def _ensure_packages(self) -> None:
@@ -158,61 +228,103 @@ class UsCertManager:
         for config in self._config.values():
             provider = config['provider']
             
-            pks = self._cert_providers[provider].get_required_packages(config)
+            pks = self._get_provider(provider).get_required_packages(config)
             
             if pks:
                 pks_needed.update(pks)
                 
-        self._logger.info(f'Packages needed: {pks_needed}. Installing them ...')
-                
-        for pk in pks_needed:
-            self._pip_manager.install(pk)
+        if pks_needed:
+            self._logger.info('Packages needed: %s. Installing them ...', pks_needed)
+            
+            self._pip_manager.install_many(list(pks_needed))
+            
+            # installed packages may add provider plugins; drop any cached probes
+            for provider in self._cert_providers.values():
+                provider.clear_packages_cache()
     
     def _sync_certs(self) -> None:
         certs = self._certs_store.get_all()
+        cached = {cert.name: cert for cert in certs}
+        
+        to_revoke = []
+        stale = []
         
         # loop through all cached certs and check if they are still present in config
         for cert in certs:
             
-            if not cert['name'] in self._config:
-                self._logger.debug(f"Cert \"{cert['name']}\" is no longer in config. Revoke needed")
+            if not cert.name in self._config:
+                self._logger.debug('Cert "%s" is no longer in config. Revoke needed', cert.name)
                 
-                try:
-                    self._revoke_cert(cert['name'], cert['provider'])
-                except Exception as e:
-                    self._logger.exception(f'Error revoking certs. Error: {e}', exc_info=True)
+                to_revoke.append((cert.name, cert.provider))
         
-        # loop through all cert configured and ensure they have a cert
+        # loop through all cert configured and ensure they have a cert;
+        # checksum the domains against the records fetched above instead of
+        # going back to the store per cert
         for name, config in self._config.items():
-            record_status = self._certs_store.check(name, config['domains'])
-
-            if record_status == CertsStore.CACHE_MISS:
-                self._logger.debug(f'Cert "{name}" is stale. (re)gen needed')
+            if name not in cached or self._certs_store.check(name, config['domains'], record=cached[name]) == CertsStore.CACHE_MISS:
+                self._logger.debug('Cert "%s" is stale. (re)gen needed', name)
                 
-                try:
-                    self._generate_cert(name, config['provider'], config)
-                except Exception as e:
-                    self._logger.exception(f'Error generating certs. Error: {e}', exc_info=True)
+                stale.append((name, config['provider'], config))
             else:
-                self._logger.debug(f'Cert "{name}" is up to date')
+                self._logger.debug('Cert "%s" is up to date', name)
+        
+        if to_revoke:
+            self._run_parallel(self._revoke_cert, to_revoke, 'Error revoking certs')
+        
+        if stale:
+            # commit all resulting store writes in one transaction
+            with self._certs_store:
+                self._run_parallel(self._generate_cert, stale, 'Error generating certs')
                 
+    def _maybe_reload_config(self) -> None:
+        config_files = self._find_config_files()
+        
+        if config_files == self._config_files and self._get_config_mtime(config_files) == self._config_mtime:
+            return
+        
+        self._logger.info('Config change detected. Reloading ...')
+        
+        old_config = self._config
+        
+        try:
+            self._config = self._parse_config()
+            self._config_check()
+        except UsCertManagerConfigError as e:
+            self._logger.error('New config is invalid, keeping the previous one. Error: %s', e)
+            self._config = old_config
+            return
+        
+        self._ensure_packages()
+        self._sync_certs()
+    
     def _renew_certs(self) -> None:
-        certs = self._certs_store.get_due_certs(30)
+        certs = self._certs_store.get_due_certs(30, limit=_RENEW_BATCH_LIMIT)
+        
+        due = []
         
         # loop through all certs that are due for renewal
         for cert in certs:
-            self._logger.debug(f"Cert \"{cert['name']}\" is due for renewal")
+            self._logger.debug('Cert "%s" is due for renewal', cert.name)
             
-            name = cert['name']
-            provider = cert['provider']
-                
-            try:
-                self._renew_cert(name, provider)
-            except Exception as e:
-                self._logger.exception(f'Error renewing certs. Error: {e}', exc_info=True)
+            due.append((cert.name, cert.provider))
+        
+        if due:
+            self._run_parallel(self._renew_cert, due, 'Error renewing certs')
+    
+    def _run_parallel(self, fn, jobs: list, error_msg: str) -> None:
+        # per-cert work is dominated by subprocesses waiting on the network,
+        # so run independent certs in parallel threads
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(8, len(jobs))) as executor:
+            futures = [executor.submit(fn, *job) for job in jobs]
+            
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    self._logger.exception('%s. Error: %s', error_msg, e, exc_info=True)
 
     def _generate_cert(self, name: str, provider: str, config: dict) -> None:
-        lifetime = self._cert_providers[provider].generate_cert(name, config)
+        lifetime = self._get_provider(provider).generate_cert(name, config)
         
         data = {
             'provider': provider,
@@ -225,7 +337,7 @@ class UsCertManager:
         self._run_hook('post_cert_gen', name)
             
     def _renew_cert(self, name: str, provider: str) -> None:
-        lifetime = self._cert_providers[provider].renew_cert(name)
+        lifetime = self._get_provider(provider).renew_cert(name)
             
         data = {
             'expiry_date': (datetime.datetime.now() + datetime.timedelta(days=lifetime)).isoformat(),
@@ -236,14 +348,14 @@ class UsCertManager:
         self._run_hook('post_cert_gen', name)
         
     def _revoke_cert(self, name: str, provider: str) -> None:
-        self._cert_providers[provider].revoke_cert(name)
+        self._get_provider(provider).revoke_cert(name)
         
         self._certs_store.remove(name)
         
         self._run_hook('post_cert_revoke', name)
         
     def _run_hook(self, hook: str, name: str) -> None:
-        self._logger.info(f'Running hook "{hook}" for "{name}"')
+        self._logger.info('Running hook "%s" for "%s"', hook, name)
         
         for hook_dir in self._hooks_dirs:
             self._exec_dir_hooks(hook, name, hook_dir)
@@ -255,26 +367,57 @@ class UsCertManager:
             return
         
         # call run-parts on hook dir
+        logger = self._logger
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
+        
         cmd_to_exec = ['run-parts', hook_dir, '--arg', name]
         
-        self._logger.debug(f'Executing command: {cmd_to_exec}')
+        if debug_enabled:
+            logger.debug('Executing command: %s', cmd_to_exec)
         
-        # create subprocess
-        exec = subprocess.run(cmd_to_exec, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        # stream hook output into the logger line by line instead of
+        # buffering it all in memory; keep a stderr tail for errors
+        stderr_tail = collections.deque(maxlen=50)
         
-        self._logger.debug(f'run-parts command return code: {exec.returncode}')
+        with subprocess.Popen(cmd_to_exec, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, close_fds=False) as proc:
+            stderr_thread = threading.Thread(target=self._drain_output, args=(proc.stderr, stderr_tail))
+            stderr_thread.start()
+            
+            self._drain_output(proc.stdout)
+            
+            stderr_thread.join()
+        
+        if debug_enabled:
+            logger.debug('run-parts command return code: %s', proc.returncode)
         
         # if return code is not 0, raise error
-        if exec.returncode != 0:
-            error_msg = exec.stderr.decode().strip()
+        if proc.returncode != 0:
+            error_msg = '\n'.join(stderr_tail).strip()
             raise UsCertManagerError(f'Error running hook "{hook}": {error_msg}')
+    
+    def _drain_output(self, pipe, tail: collections.deque = None) -> None:
+        debug = self._logger.debug
         
-        return exec.stdout.decode().strip()
+        for line in pipe:
+            line = line.rstrip()
+            
+            if line:
+                debug(line)
+            
+            if tail is not None and line:
+                tail.append(line)
         
     def _run_forever(self) -> None:
+        import asyncio
+        
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
         
+        # pin renew runs to a single persistent worker thread so its warm
+        # state survives between daily wakes
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='renew')
+        loop.set_default_executor(executor)
+        
         tasks = [
             loop.create_task(self._renew_certs_task()),
         ]
@@ -292,10 +435,13 @@ class UsCertManager:
                 self._cancel_tasks(loop)
                 loop.run_until_complete(loop.shutdown_asyncgens())
             finally:
+                executor.shutdown(wait=False, cancel_futures=True)
                 asyncio.set_event_loop(None)
                 loop.close()
                 
-    def _cancel_tasks(self, loop: asyncio.AbstractEventLoop) -> None:
+    def _cancel_tasks(self, loop) -> None:
+        import asyncio
+        
         tasks = asyncio.all_tasks(loop=loop)
 
         if not tasks:
@@ -318,19 +464,30 @@ class UsCertManager:
                 })
         
     async def _renew_certs_task(self) -> None:
+        import asyncio
+        
+        # schedule runs against an absolute 02:00 deadline that is advanced
+        # by a day per iteration, so clock reads can't skew the cadence
+        now = datetime.datetime.now()
+        next_run = datetime.datetime(now.year, now.month, now.day, 2, 0)
+        
+        if now > next_run:
+            next_run += datetime.timedelta(days=1)
+        
         while True:
+            # pick up config edits without a restart; a cheap stat pass
+            # decides whether anything needs reparsing
+            await asyncio.to_thread(self._maybe_reload_config)
+            
             # run renew certs as an asyncio task
             await asyncio.to_thread(self._renew_certs)
             
-            # sleep until 02:00
-            now = datetime.datetime.now()
-            next_run = datetime.datetime(now.year, now.month, now.day, 2, 0)
+            # sleep until 02:00; total_seconds keeps the day component that
+            # .seconds silently dropped
+            sleep_time = max(0.0, (next_run - datetime.datetime.now()).total_seconds())
             
-            if now > next_run:
-                next_run += datetime.timedelta(days=1)
-                
-            sleep_time = (next_run - now).seconds
+            self._logger.info('Next certs check in %s seconds', sleep_time)
             
-            self._logger.info(f'Next certs check in {sleep_time} seconds')
+            await asyncio.sleep(sleep_time)
             
-            await asyncio.sleep(sleep_time)
\ No newline at end of file
+            next_run += datetime.timedelta(days=1)
\ No newline at end of file
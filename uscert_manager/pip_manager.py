@@ -12,25 +12,30 @@ class PipManager:
         self._logger = logger.getChild('pip_manager')
         
     def install(self, package: str) -> None:
+        self.install_many([package])
+        
+    def install_many(self, packages: list) -> None:
         # ensure only alphanumeric and hyphen characters are present
-        if not package.replace('-', '').isalnum():
-            raise PipManagerError(f'Invalid package name "{package}"')
+        for package in packages:
+            if not package.replace('-', '').isalnum():
+                raise PipManagerError(f'Invalid package name "{package}"')
         
-        self._logger.info(f'Installing package "{package}"')
+        self._logger.info('Installing packages "%s"', ', '.join(packages))
         
-        command = ['install', package]
+        # install everything in one pip run so the resolver runs only once
+        command = ['install', *packages]
         
         self._pip_exec(command)
         
     def _pip_exec(self, cmd: list) -> str:
         cmd_to_exec = [self._pip_bin, *cmd]
         
-        self._logger.debug(f'Executing command: {cmd_to_exec}')
+        self._logger.debug('Executing command: %s', cmd_to_exec)
         
         # create subprocess
-        exec = subprocess.run(cmd_to_exec, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        exec = subprocess.run(cmd_to_exec, stdout=subprocess.PIPE, stderr=subprocess.PIPE, close_fds=False)
         
-        self._logger.debug(f'Pip command return code: {exec.returncode}')
+        self._logger.debug('Pip command return code: %s', exec.returncode)
         
         # if return code is not 0, raise error
         if exec.returncode != 0:
@@ -1,12 +1,42 @@
 import logging
 import os
+import json
 import shutil
+import itertools
 import subprocess
+import threading
+import collections
+
+_REQUIRED_CFG_KEYS = ('authenticator', 'email', 'domains')
+
+_DISALLOWED_OPTS = frozenset({
+    'provider',
+    'non-interactive',
+    'agree-tos',
+    'renew-with-new-domains',
+    'config-dir',
+    'work-dir',
+    'max-log-backups',
+    'cert-name',
+    'domains',
+})
 
 class CertbotProviderError(Exception):
     pass
 
 class CertbotProvider:
+    __slots__ = (
+        '_certs_dir',
+        '_data_dir',
+        '_certbot_bin',
+        '_cert_lifetime',
+        '_common_args',
+        '_live_dir',
+        '_logger',
+        '_authenticators_cache',
+        '_available_authenticators',
+    )
+
     def __init__(self, certs_dir: str, data_dir: str, bin_path: str, *, logger: logging.Logger) -> None:
         self._certs_dir = certs_dir
         self._data_dir = data_dir
@@ -14,67 +44,56 @@ class CertbotProvider:
         self._certbot_bin = os.path.join(bin_path, 'certbot') if bin_path else 'certbot'
         self._cert_lifetime = 90
         
+        # args shared by every certbot invocation, built once
+        self._common_args = ['--config-dir', self._data_dir, '--work-dir', self._data_dir, '--max-log-backups', '0']
+        self._live_dir = os.path.join(self._data_dir, 'live')
+        
         self._logger = logger.getChild('certbot')
         
-        self._available_authenticators = self._get_authenticators()
+        self._authenticators_cache = os.path.join(data_dir, '.certbot_authenticators.json')
+        # resolved lazily; only get_required_packages needs the probe
+        self._available_authenticators = None
         
     def config_check(self, config: dict) -> None:
-        required_keys = ['authenticator', 'email', 'domains']
-        
         # check if all required keys are present in config
-        for key in required_keys:
+        for key in _REQUIRED_CFG_KEYS:
             if not key in config:
                 raise CertbotProviderError(f'Config is missing required key "{key}"')
         
     def get_required_packages(self, config: dict) -> list:
         pks = []
         
+        if self._available_authenticators is None:
+            self._available_authenticators = self._load_authenticators()
+        
         if not config['authenticator'] in self._available_authenticators:
             pks.append(f'certbot-{config["authenticator"]}')
             
         return pks
         
     def generate_cert(self, name: str, config: dict) -> int:
-        required_keys = ['authenticator', 'email', 'domains']
+        # config_check has already validated managed configs; keep a single
+        # cheap guard for programmatic callers
+        missing = set(_REQUIRED_CFG_KEYS) - config.keys()
         
-        # check if all required keys are present in config
-        for key in required_keys:
-            if not key in config:
-                raise CertbotProviderError(f'Config is missing required key "{key}"')
+        if missing:
+            raise CertbotProviderError(f'Config is missing required key "{next(iter(missing))}"')
         
         command = [
             'certonly',
             '--non-interactive',
             '--agree-tos',
             '--renew-with-new-domains',
-            '--config-dir', self._data_dir,
-            '--work-dir', self._data_dir,
-            '--max-log-backups', '0',
+            *self._common_args,
             '--cert-name', name,
             '--domains', ','.join(config['domains']),
         ]
         
-        disallowed_config_opts = [
-            'provider',
-            'non-interactive',
-            'agree-tos',
-            'renew-with-new-domains',
-            'config-dir',
-            'work-dir',
-            'max-log-backups',
-            'cert-name',
-            'domains',
-        ]
-        
-        # add config opts
-        for key, value in config.items():
-            if key in disallowed_config_opts:
-                continue
+        # add config opts, flattened into the command in one extend
+        extras = [(f'--{key}', value) for key, value in config.items() if key not in _DISALLOWED_OPTS]
+        command.extend(itertools.chain.from_iterable(extras))
             
-            command.append(f'--{key}')
-            command.append(value)
-            
-        self._logger.info(f'Generating certificate for "{name}". Members: {config["domains"]}')
+        self._logger.info('Generating certificate for "%s". Members: %s', name, config['domains'])
             
         self._certbot_exec(command)
         
@@ -88,13 +107,11 @@ class CertbotProvider:
             '--non-interactive',
             '--no-random-sleep-on-renew',
             '--force-renewal',
-            '--config-dir', self._data_dir,
-            '--work-dir', self._data_dir,
-            '--max-log-backups', '0',
+            *self._common_args,
             '--cert-name', name,
         ]
         
-        self._logger.info(f'Renewing certificate for "{name}"')
+        self._logger.info('Renewing certificate for "%s"', name)
         
         self._certbot_exec(command)
         
@@ -107,21 +124,58 @@ class CertbotProvider:
             'revoke',
             '--non-interactive',
             '--delete-after-revoke',
-            '--config-dir', self._data_dir,
-            '--work-dir', self._data_dir,
-            '--max-log-backups', '0',
+            *self._common_args,
             '--cert-name', name,
         ]
         
-        self._logger.info(f'Removing certificate "{name}"')
+        self._logger.info('Removing certificate "%s"', name)
         
         self._certbot_exec(command)
         
         self._remove_cert_files(name)
+        
+    def clear_packages_cache(self) -> None:
+        # drop the cached authenticators list so the next use re-probes certbot
+        self._available_authenticators = None
+        
+        if os.path.exists(self._authenticators_cache):
+            os.remove(self._authenticators_cache)
+    
+    def _load_authenticators(self) -> list:
+        cache_key = self._authenticators_cache_key()
+        
+        # reuse the cached probe result if it still matches the certbot binary
+        if cache_key:
+            try:
+                with open(self._authenticators_cache, 'r') as f:
+                    cached = json.load(f)
+                
+                if cached.get('key') == cache_key:
+                    return cached['list']
+            except (OSError, ValueError):
+                pass
+        
+        authenticators = self._get_authenticators()
+        
+        if cache_key:
+            with open(self._authenticators_cache, 'w') as f:
+                json.dump({'key': cache_key, 'list': authenticators}, f)
+        
+        return authenticators
+    
+    def _authenticators_cache_key(self) -> list:
+        certbot_path = shutil.which(self._certbot_bin) or self._certbot_bin
+        
+        try:
+            mtime = os.stat(certbot_path).st_mtime_ns
+        except OSError:
+            return None
+        
+        return [os.path.realpath(certbot_path), mtime]
     
     def _get_authenticators(self) -> None:        
         # get authenticators list fro certbot cli
-        certbot_authenticators = self._certbot_exec(['plugins', '--authenticators'])
+        certbot_authenticators = self._certbot_exec(['plugins', '--authenticators'], stream=False)
         
         # keep only lines that start with * (plugin name)
         certbot_authenticators = [x.lstrip('*').strip() for x in certbot_authenticators.split('\n') if x.startswith('* ')]
@@ -129,53 +183,121 @@ class CertbotProvider:
         return certbot_authenticators
 
     def _copy_cert_files(self, name: str) -> None:
-        le_dir = os.path.join(self._data_dir, 'live', name)
+        le_dir = os.path.join(self._live_dir, name)
         target_dir = os.path.join(self._certs_dir, name)
         
-         # create cert dir if it doesn't exist
-        if not os.path.exists(target_dir):
-            os.makedirs(target_dir)
+        # create cert dir if it doesn't exist
+        os.makedirs(target_dir, exist_ok=True)
         
-        for file in os.listdir(le_dir):
-            if file.endswith('.pem'):
-                src_file = os.path.join(le_dir, file)
-                dst_file = os.path.join(target_dir, file)
-                
-                self._logger.debug(f'Copying "{src_file}" to "{dst_file}"')
-                
-                shutil.copyfile(src_file, dst_file)
+        with os.scandir(le_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith('.pem') and entry.is_file():
+                    dst_file = os.path.join(target_dir, entry.name)
+
+                    self._logger.debug('Copying "%s" to "%s"', entry.path, dst_file)
+
+                    # the private key stays key-private; public pem files are world-readable
+                    mode = 0o600 if entry.name == 'privkey.pem' else 0o644
+
+                    self._copy_file(entry.path, dst_file, mode)
                 
-        self._gen_cert_variants(name)
+        self._gen_cert_variants(name, le_dir)
                 
     def _remove_cert_files(self, name: str) -> None:
         target_dir = os.path.join(self._certs_dir, name)
         
         if os.path.exists(target_dir):
-            self._logger.debug(f'Removing certificate files for "{name}"')
+            self._logger.debug('Removing certificate files for "%s"', name)
             shutil.rmtree(target_dir)
             
-    def _gen_cert_variants(self, name: str) -> None:
+    def _gen_cert_variants(self, name: str, src_dir: str) -> None:
         target_dir = os.path.join(self._certs_dir, name)
         
-        # create a combined.pem file
-        with open(os.path.join(target_dir, 'combined.pem'), 'wb') as f:
+        # create a combined.pem file straight from the certbot output; it
+        # embeds the private key, so keep it key-private
+        dst_fd = os.open(os.path.join(target_dir, 'combined.pem'), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        
+        try:
             for file in ['fullchain.pem', 'privkey.pem']:
-                with open(os.path.join(target_dir, file), 'rb') as src:
-                    shutil.copyfileobj(src, f)
+                self._sendfile(os.path.join(src_dir, file), dst_fd)
+        finally:
+            os.close(dst_fd)
     
-    def _certbot_exec(self, cmd: list) -> str:
+    def _copy_file(self, src_file: str, dst_file: str, mode: int = 0o644) -> None:
+        dst_fd = os.open(dst_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+        
+        try:
+            self._sendfile(src_file, dst_fd)
+        finally:
+            os.close(dst_fd)
+    
+    def _sendfile(self, src_file: str, dst_fd: int) -> None:
+        # move the bytes in-kernel instead of through a userspace buffer
+        src_fd = os.open(src_file, os.O_RDONLY)
+        
+        try:
+            while os.sendfile(dst_fd, src_fd, None, 2 ** 20):
+                pass
+        finally:
+            os.close(src_fd)
+    
+    def _certbot_exec(self, cmd: list, *, stream: bool = True) -> str:
+        # bind hot attributes once and skip f-string construction when debug
+        # logging is filtered out (the production default)
+        logger = self._logger
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
+        
         cmd_to_exec = [self._certbot_bin, *cmd]
         
-        self._logger.debug(f'Executing command: {cmd_to_exec}')
+        if debug_enabled:
+            logger.debug('Executing command: %s', cmd_to_exec)
         
-        # create subprocess
-        exec = subprocess.run(cmd_to_exec, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if not stream:
+            # short probes are buffered so the caller can parse the output
+            exec = subprocess.run(cmd_to_exec, stdout=subprocess.PIPE, stderr=subprocess.PIPE, close_fds=False)
+            
+            if debug_enabled:
+                logger.debug('certbot command return code: %s', exec.returncode)
+            
+            # if return code is not 0, raise error
+            if exec.returncode != 0:
+                error_msg = exec.stderr.decode().strip()
+                raise CertbotProviderError(f'certbot command failed with return code {exec.returncode} ({error_msg})')
+            
+            return exec.stdout.decode().strip()
+        
+        # stream long-running command output into the logger line by line
+        # instead of buffering it all in memory; keep a stderr tail for errors
+        stderr_tail = collections.deque(maxlen=50)
+        
+        # close_fds=False skips the pre-exec fd-table scan and keeps the
+        # spawn on the fast posix_spawn path; no sensitive fds are open
+        with subprocess.Popen(cmd_to_exec, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, close_fds=False) as proc:
+            stderr_thread = threading.Thread(target=self._drain_output, args=(proc.stderr, stderr_tail))
+            stderr_thread.start()
+            
+            self._drain_output(proc.stdout)
+            
+            stderr_thread.join()
         
-        self._logger.debug(f'certbot command return code: {exec.returncode}')
+        if debug_enabled:
+            logger.debug('certbot command return code: %s', proc.returncode)
         
         # if return code is not 0, raise error
-        if exec.returncode != 0:
-            error_msg = exec.stderr.decode().strip()
-            raise CertbotProviderError(f'certbot command failed with return code {exec.returncode} ({error_msg})')
+        if proc.returncode != 0:
+            error_msg = '\n'.join(stderr_tail).strip()
+            raise CertbotProviderError(f'certbot command failed with return code {proc.returncode} ({error_msg})')
+        
+        return ''
+    
+    def _drain_output(self, pipe, tail: collections.deque = None) -> None:
+        debug = self._logger.debug
         
-        return exec.stdout.decode().strip()
\ No newline at end of file
+        for line in pipe:
+            line = line.rstrip()
+            
+            if line:
+                debug(line)
+            
+            if tail is not None and line:
+                tail.append(line)
\ No newline at end of file
@@ -1,13 +1,28 @@
 import logging
 import os
-import json
 import shutil
+import datetime
 import subprocess
+from uscert_manager import jsonutil
+
+# generating keys/certs in-process avoids forking the openssl CLI per cert;
+# fall back to the CLI when python-cryptography is not installed
+try:
+    from cryptography import x509
+    from cryptography.x509.oid import NameOID
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+except ImportError:
+    x509 = None
+
+_REQUIRED_CFG_KEYS = ('domains',)
 
 class OpenSslProviderError(Exception):
     pass
 
 class OpenSslProvider:
+    __slots__ = ('_certs_dir', '_data_dir', '_renewal_dir', '_openssl_bin', '_logger')
+
     def __init__(self, certs_dir: str, data_dir: str, bin_path: str, *, logger: logging.Logger) -> None:
         self._certs_dir = certs_dir
         self._data_dir = data_dir
@@ -15,37 +30,36 @@ class OpenSslProvider:
         self._renewal_dir = os.path.join(data_dir, 'renewal_openssl')
         self._openssl_bin = 'openssl'
         
+        # create renewal dir if it doesn't exist
+        os.makedirs(self._renewal_dir, exist_ok=True)
+        
         self._logger = logger.getChild('openssl')
         
     def config_check(self, config: dict) -> None:
-        required_keys = ['domains']
-        
         # check if all required keys are present in config
-        for key in required_keys:
+        for key in _REQUIRED_CFG_KEYS:
             if not key in config:
                 raise OpenSslProviderError(f'Config is missing required key "{key}"')
         
     def get_required_packages(self, config: dict) -> list:
         return []
     
+    def clear_packages_cache(self) -> None:
+        pass
+    
     # generate self-signed certificate using .pem files
     def generate_cert(self, name: str, config: dict) -> int:
-        required_keys = ['domains']
+        # config_check has already validated managed configs; keep a single
+        # cheap guard for programmatic callers
+        missing = set(_REQUIRED_CFG_KEYS) - config.keys()
         
-        # check if all required keys are present in config
-        for key in required_keys:
-            if not key in config:
-                raise OpenSslProviderError(f'Config is missing required key "{key}"')
+        if missing:
+            raise OpenSslProviderError(f'Config is missing required key "{next(iter(missing))}"')
             
         target_dir = os.path.join(self._certs_dir, name)
         
         # create cert dir if it doesn't exist
-        if not os.path.exists(target_dir):
-            os.makedirs(target_dir)
-            
-        # create renewal dir if it doesn't exist
-        if not os.path.exists(self._renewal_dir):
-            os.makedirs(self._renewal_dir)
+        os.makedirs(target_dir, exist_ok=True)
             
         key_file = os.path.join(target_dir, 'private.pem')
         crt_file = os.path.join(target_dir, 'cert.pem')
@@ -53,21 +67,27 @@ class OpenSslProvider:
         # parse int
         lifetime = int(config.get('days', 365))
         
-        command = [
-            'req',
-            '-x509',
-            '-nodes',
-            '-days', str(lifetime),
-            '-newkey', 'rsa:2048',
-            '-keyout', key_file,
-            '-out', crt_file,
-            '-subj', f'/O=uscert-manager/CN={name}',
-            '-addext', 'subjectAltName=DNS:{}'.format('\,DNS:'.join(config['domains'])),
-        ]
-        
-        self._logger.info(f'Generating self-signed certificate for "{name}"')
-        
-        self._openssl_exec(command)
+        self._logger.info('Generating self-signed certificate for "%s"', name)
+        
+        cert_pem = None
+        key_pem = None
+        
+        if x509 is not None:
+            cert_pem, key_pem = self._generate_cert_files(name, config['domains'], lifetime, key_file, crt_file)
+        else:
+            command = [
+                'req',
+                '-x509',
+                '-nodes',
+                '-days', str(lifetime),
+                '-newkey', 'rsa:2048',
+                '-keyout', key_file,
+                '-out', crt_file,
+                '-subj', f'/O=uscert-manager/CN={name}',
+                '-addext', 'subjectAltName={}'.format(','.join('DNS:' + x for x in config['domains'])),
+            ]
+            
+            self._openssl_exec(command)
         
         # write generation config to renewal config file
         renewal_config_data = {
@@ -78,7 +98,7 @@ class OpenSslProvider:
         
         self._write_renewal_config(name, renewal_config_data)
         
-        self._gen_cert_variants(name)
+        self._gen_cert_variants(name, cert_pem, key_pem)
             
         return lifetime
     
@@ -91,7 +111,7 @@ class OpenSslProvider:
         
         # parse renewal config file into dict
         with open(renewal_config, 'r') as f:
-            renewal_data = json.loads(f.read())
+            renewal_data = jsonutil.loads(f.read())
             
         return self.generate_cert(name, renewal_data)
     
@@ -100,7 +120,7 @@ class OpenSslProvider:
         target_dir = os.path.join(self._certs_dir, name)
         
         if os.path.exists(target_dir):
-            self._logger.info(f'Revoking certificate for "{name}"')
+            self._logger.info('Revoking certificate for "%s"', name)
             shutil.rmtree(target_dir)
             
         # remove renewal config
@@ -109,29 +129,77 @@ class OpenSslProvider:
         if os.path.exists(renewal_config):
             os.remove(renewal_config)
             
+    def _generate_cert_files(self, name: str, domains: list, lifetime: int, key_file: str, crt_file: str) -> tuple:
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        
+        subject = x509.Name([
+            x509.NameAttribute(NameOID.ORGANIZATION_NAME, 'uscert-manager'),
+            x509.NameAttribute(NameOID.COMMON_NAME, name),
+        ])
+        
+        now = datetime.datetime.now(datetime.timezone.utc)
+        
+        cert = (
+            x509.CertificateBuilder()
+            .subject_name(subject)
+            .issuer_name(subject)
+            .public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now)
+            .not_valid_after(now + datetime.timedelta(days=lifetime))
+            .add_extension(x509.SubjectAlternativeName([x509.DNSName(x) for x in domains]), critical=False)
+            .sign(key, hashes.SHA256())
+        )
+        
+        key_pem = key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.TraditionalOpenSSL,
+            encryption_algorithm=serialization.NoEncryption(),
+        )
+        
+        cert_pem = cert.public_bytes(serialization.Encoding.PEM)
+        
+        # key is unencrypted; match the 0600 mode the openssl CLI uses for -keyout
+        with os.fdopen(os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as f:
+            f.write(key_pem)
+
+        with open(crt_file, 'wb') as f:
+            f.write(cert_pem)
+
+        return cert_pem, key_pem
+    
     def _write_renewal_config(self, name: str, data: dict) -> None:
         # write renewal config file
         with open(os.path.join(self._renewal_dir, f'{name}.conf'), 'w') as f:
-            f.write(json.dumps(data))
+            f.write(jsonutil.dumps(data))
             
-    def _gen_cert_variants(self, name: str) -> None:
+    def _gen_cert_variants(self, name: str, cert_pem: bytes = None, key_pem: bytes = None) -> None:
         target_dir = os.path.join(self._certs_dir, name)
         
-        # create a combined.pem file
-        with open(os.path.join(target_dir, 'combined.pem'), 'wb') as f:
-            for file in ['cert.pem', 'private.pem']:
-                with open(os.path.join(target_dir, file), 'rb') as src:
-                    shutil.copyfileobj(src, f)
+        # reuse the in-memory pem bytes when in-process generation produced
+        # them; only the CLI fallback has to read them back from disk
+        if cert_pem is None or key_pem is None:
+            with open(os.path.join(target_dir, 'cert.pem'), 'rb') as f:
+                cert_pem = f.read()
+            
+            with open(os.path.join(target_dir, 'private.pem'), 'rb') as f:
+                key_pem = f.read()
+        
+        # create a combined.pem file; it embeds the key, so keep it key-private
+        combined_file = os.path.join(target_dir, 'combined.pem')
+
+        with os.fdopen(os.open(combined_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as f:
+            f.write(cert_pem + key_pem)
     
     def _openssl_exec(self, cmd: list) -> str:
         cmd_to_exec = [self._openssl_bin, *cmd]
         
-        self._logger.debug(f'Executing command: {cmd_to_exec}')
+        self._logger.debug('Executing command: %s', cmd_to_exec)
         
         # create subprocess
-        exec = subprocess.run(cmd_to_exec, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        exec = subprocess.run(cmd_to_exec, stdout=subprocess.PIPE, stderr=subprocess.PIPE, close_fds=False)
         
-        self._logger.debug(f'openssl command return code: {exec.returncode}')
+        self._logger.debug('openssl command return code: %s', exec.returncode)
         
         # if return code is not 0, raise error
         if exec.returncode != 0:
@@ -1,113 +1,152 @@
 import os
 import sqlite3
 import hashlib
-import json
 import logging
+import threading
+import functools
+import collections
+from uscert_manager import jsonutil
+
+# lighter than building a dict per fetched row; rows are read-only anyway
+Cert = collections.namedtuple('Cert', ('name', 'provider', 'domains', 'expiry_date', 'checksum'))
+
+@functools.lru_cache(maxsize=1024)
+def _members_checksum(members: tuple) -> str:
+    # members must be pre-sorted; each unique domain set is hashed once
+    return hashlib.sha256(''.join(members).encode()).hexdigest()
+
+@functools.lru_cache(maxsize=2048)
+def _parse_domains(domains: str) -> list:
+    # the same domains string recurs across syncs/renews; parse it once
+    return jsonutil.loads(domains)
 
 class CertsStore:
     CACHE_MISS = 'MISS'
     CACHE_HIT = 'HIT'
     
+    def __enter__(self):
+        # batch every write inside the block into a single transaction, so
+        # N replaces cost one fsync instead of N
+        with self._lock:
+            self._cursor.execute('BEGIN IMMEDIATE')
+        
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        with self._lock:
+            if exc_type is None:
+                self._cursor.execute('COMMIT')
+            else:
+                self._cursor.execute('ROLLBACK')
+        
+        return False
+    
     def __init__(self, data_dir: str, *, logger: logging.Logger) -> None:
         self._logger = logger.getChild('certs_store')
         self._db = None
+        self._cursor = None
+        # serialize access; the sync/renew thread pool shares this connection
+        self._lock = threading.Lock()
         
         self._init_db(os.path.join(data_dir, 'certs.db'))
         
     def replace(self, name: str, *, provider: str, domains: dict, expiry_date: str) -> None:
         # sort members list to ensure consistent hash
-        checksum = hashlib.sha256(''.join(sorted(domains)).encode()).hexdigest()
+        checksum = _members_checksum(tuple(sorted(domains)))
         
         sql = 'REPLACE INTO certs (name, provider, domains, expiry_date, checksum) VALUES (?, ?, ?, ?, ?)'
         
         # insert or replace cert data
-        cursor = self._db.cursor()
-        cursor.execute(sql, (name, provider, json.dumps(domains), expiry_date, checksum))
-        self._db.commit()
+        with self._lock:
+            self._cursor.execute(sql, (name, provider, jsonutil.dumps(domains), expiry_date, checksum))
         
-        self._logger.debug(f'Replaced cert record for "{name}"')
+        self._logger.debug('Replaced cert record for "%s"', name)
         
     def remove(self, name: str) -> None:
-        cursor = self._db.cursor()
+        with self._lock:
+            self._cursor.execute('DELETE FROM certs WHERE name = ?', (name,))
         
-        cursor.execute('DELETE FROM certs WHERE name = ? LIMIT 1', (name,))
-        self._db.commit()
-        
-        self._logger.debug(f'Removed cert record for "{name}"')
+        self._logger.debug('Removed cert record for "%s"', name)
         
     def update(self, name: str, expiry_date: str) -> None:
-        cursor = self._db.cursor()
-        
-        cursor.execute('UPDATE certs SET expiry_date = ? WHERE name = ?', (expiry_date, name))
-        self._db.commit()
+        with self._lock:
+            self._cursor.execute('UPDATE certs SET expiry_date = ? WHERE name = ?', (expiry_date, name))
         
-        self._logger.debug(f'Updated expiry date for "{name}"')
+        self._logger.debug('Updated expiry date for "%s"', name)
 
-    def check(self, name: str, members: list[str]) -> str:
-        cert = self.get(name)
+    def check(self, name: str, members: list[str], record: Cert = None) -> str:
+        # callers that already hold the record can pass it in to skip the lookup
+        cert = record if record is not None else self.get(name)
         
         if not cert:
             return self.CACHE_MISS
 
         # sort members list to ensure consistent hash
-        checksum = hashlib.sha256(''.join(sorted(members)).encode()).hexdigest()
+        checksum = _members_checksum(tuple(sorted(members)))
 
         # check if cache content matches members hash
-        if cert['checksum'] == checksum:
+        if cert.checksum == checksum:
             return self.CACHE_HIT
         
         return self.CACHE_MISS
     
-    def get(self, name: str) -> str:
-        cursor = self._db.cursor()
-        
-        cursor.execute('SELECT * FROM certs WHERE name = ?', (name,))
-        
-        res = cursor.fetchone()
+    def get(self, name: str) -> Cert:
+        with self._lock:
+            self._cursor.execute('SELECT name, provider, domains, expiry_date, checksum FROM certs WHERE name = ?', (name,))
+            
+            res = self._cursor.fetchone()
         
         if not res:
             return None
         
-        res = dict(res)
-        res['domains'] = json.loads(res['domains'])
-        
-        return res
+        return self._build_cert(res)
     
     def get_all(self) -> list:
-        cursor = self._db.cursor()
-        
-        cursor.execute('SELECT * FROM certs')
-        
-        res_obj = cursor.fetchall()
-        
-        res_dict = [dict(row) for row in res_obj]
-        
-        # convert domains to list
-        for res in res_dict:
-            res['domains'] = json.loads(res['domains'])
+        with self._lock:
+            self._cursor.execute('SELECT name, provider, domains, expiry_date, checksum FROM certs')
             
-        return res_dict
-    
-    def get_due_certs(self, days: int) -> list:
-        cursor = self._db.cursor()
-        
-        cursor.execute('SELECT * FROM certs WHERE expiry_date < datetime("now", ?)', (f'+{days} days',))
+            res_obj = self._cursor.fetchall()
         
-        res_obj = cursor.fetchall()
+        return [self._build_cert(row) for row in res_obj]
+    
+    def get_due_certs(self, days: int, limit: int = None) -> list:
+        sql = 'SELECT name, provider, domains, expiry_date, checksum FROM certs WHERE expiry_date < datetime("now", ?) ORDER BY expiry_date'
+        params = [f'+{days} days']
+        
+        # a limit lets the caller spread a large backlog over several runs,
+        # soonest-expiring certs first
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        
+        with self._lock:
+            self._cursor.execute(sql, params)
+            
+            res_obj = self._cursor.fetchall()
         
-        res_dict = [dict(row) for row in res_obj]
+        return [self._build_cert(row) for row in res_obj]
+    
+    def _build_cert(self, row: tuple) -> Cert:
+        name, provider, domains, expiry_date, checksum = row
         
-        # convert domains to list
-        for res in res_dict:
-            res['domains'] = json.loads(res['domains'])
-            
-        return res_dict
+        return Cert(name, provider, _parse_domains(domains), expiry_date, checksum)
     
     def _init_db(self, db_path: str) -> None:
-        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        # manual transaction control: statements autocommit unless wrapped
+        # in the explicit BEGIN/COMMIT of the context manager below
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        
+        # WAL lets readers and the writer proceed concurrently and costs
+        # fewer fsyncs per commit than the default rollback journal
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('PRAGMA temp_store=MEMORY')
+        
+        self._cursor = self._db.cursor()
         
-        self._db.row_factory = sqlite3.Row
+        # WITHOUT ROWID stores rows in the name b-tree itself, skipping the
+        # hidden rowid indirection on every PK lookup
+        self._cursor.execute('CREATE TABLE IF NOT EXISTS certs (name TEXT PRIMARY KEY, provider TEXT, domains TEXT, expiry_date TEXT, checksum TEXT) WITHOUT ROWID')
         
-        cursor = self._db.cursor()
-        cursor.execute('CREATE TABLE IF NOT EXISTS certs (name TEXT PRIMARY KEY, provider TEXT, domains TEXT, expiry_date TEXT, checksum TEXT)')
-        self._db.commit()
\ No newline at end of file
+        # get_due_certs filters and orders on expiry_date
+        self._cursor.execute('CREATE INDEX IF NOT EXISTS certs_expiry ON certs(expiry_date)')
\ No newline at end of file